@@ -1,20 +1,31 @@
 from vec_graph_db.vectorDB_semantic_search import SemanticSearchEngine
-from vec_graph_db.neo4j_graphDB_search import KnowledgeGraph
+from vec_graph_db.neo4j_graphDB_search import KnowledgeGraph, new_uuid
 from neo4j import GraphDatabase 
 
 class HybridSearchEngine:
     def __init__(self, vector_model="all-MiniLM-L6-v2", vector_collection="hybrid_search",
-                 neo4j_uri="bolt://localhost:7687", neo4j_user="neo4j", neo4j_password="password"):
-        # Initialize vector search engine
-        self.vector_search = SemanticSearchEngine(model_name=vector_model, collection_name=vector_collection)
+                 neo4j_uri="bolt://localhost:7687", neo4j_user="neo4j", neo4j_password="password",
+                 recreate=False):
+        # Initialize vector search engine; IVF_SQ8 keeps per-document inserts cheap
+        self.vector_search = SemanticSearchEngine(model_name=vector_model, collection_name=vector_collection,
+                                                  index_type="IVF_SQ8", recreate=recreate)
         
         # Initialize knowledge graph
         self.graph = KnowledgeGraph(uri=neo4j_uri, user=neo4j_user, password=neo4j_password)
         
+        # Documents are keyed on (collection, vector_id); a recreated collection
+        # restarts its IDs at 0, so its old documents have to go too
+        self.collection = vector_collection
+        if recreate:
+            self.graph.run_query(
+                "MATCH (d:Document {collection: $collection}) DETACH DELETE d",
+                {"collection": self.collection}
+            )
+        
         # Map between Milvus IDs and Neo4j document IDs
         self.id_mapping = {}
     
-    def add_document(self, text, properties=None):
+    def add_document(self, text, properties=None, topics=None):
         # Add to vector database
         vector_ids = self.vector_search.add_documents([text])
         vector_id = vector_ids[0]
@@ -22,16 +33,63 @@ class HybridSearchEngine:
         # Add to graph database
         props = properties or {}
         props["content"] = text
+        props["collection"] = self.collection
         props["vector_id"] = vector_id
         
         doc_name = props.get("name", f"Document-{vector_id}")
         doc_node = self.graph.create_entity("Document", doc_name, props)
         
+        # Connect document to its topics, creating missing topics on the fly
+        for topic_name in topics or []:
+            self.graph.upsert_covers(doc_node["uuid"], topic_name)
+        
         # Store mapping
         self.id_mapping[vector_id] = doc_node.id
         
         return vector_id, doc_node
     
+    def add_documents_bulk(self, docs):
+        # Encode and insert every document into the vector database at once
+        texts = [doc["text"] for doc in docs]
+        vector_ids = self.vector_search.add_documents(texts)
+        
+        # Build one row per document for a single UNWIND write
+        rows = []
+        for doc, vector_id in zip(docs, vector_ids):
+            props = dict(doc.get("properties") or {})
+            props["name"] = doc.get("name", props.get("name", f"Document-{vector_id}"))
+            props["content"] = doc["text"]
+            props["collection"] = self.collection
+            props["vector_id"] = vector_id
+            props["uuid"] = new_uuid()
+            # Each topic carries a uuid to use if the MERGE creates it
+            topics = [{"name": name, "uuid": new_uuid()} for name in doc.get("topics", [])]
+            rows.append({"props": props, "topics": topics})
+        
+        # Create documents, merge their topics and connect them in one transaction
+        cypher_query = """
+        UNWIND $rows AS r
+        CREATE (d:Document)
+        SET d = r.props
+        FOREACH (topic IN r.topics |
+            MERGE (t:Topic {name: topic.name})
+            ON CREATE SET t.uuid = topic.uuid
+            MERGE (d)-[:COVERS]->(t)
+        )
+        RETURN d
+        """
+        with self.graph.driver.session(database=self.graph.database) as session:
+            records = session.execute_write(
+                lambda tx: list(tx.run(cypher_query, {"rows": rows}))
+            )
+        doc_nodes = [record["d"] for record in records]
+        
+        # Store mapping
+        for vector_id, doc_node in zip(vector_ids, doc_nodes):
+            self.id_mapping[vector_id] = doc_node.id
+        
+        return vector_ids, doc_nodes
+    
     def add_topic(self, name, properties=None):
         return self.graph.create_entity("Topic", name, properties)
     
@@ -40,7 +98,8 @@ class HybridSearchEngine:
         topic = self.graph.get_entity_by_name("Topic", topic_name)
         
         if doc and topic:
-            self.graph.create_relationship(doc, relationship_type, topic)
+            self.graph.create_relationship(doc, relationship_type, topic,
+                                           from_label="Document", to_label="Topic")
             return True
         return False
     
@@ -51,83 +110,81 @@ class HybridSearchEngine:
         if not include_related:
             return vector_results
         
-        # Get document names from vector search results
-        doc_contents = [result["text"] for result in vector_results]
+        # Get Milvus IDs from vector search results
+        vector_ids = [result["id"] for result in vector_results]
         
-        # Find these documents in the graph
+        # Find these documents in the graph through the (collection, vector_id) constraint;
+        # vector IDs alone repeat across collections. Topics are shared by name across
+        # collections, so related documents are scoped to this collection too
         cypher_query = """
         MATCH (d:Document)
-        WHERE d.content IN $contents
+        WHERE d.collection = $collection AND d.vector_id IN $ids
+        WITH collect(d) AS hits
+        UNWIND hits AS d
         OPTIONAL MATCH (d)-[:COVERS]->(t:Topic)
         OPTIONAL MATCH (t)<-[:COVERS]-(related:Document)
-        WHERE NOT related.content IN $contents
-        RETURN d.name as document, d.content as content, 
+        WHERE related.collection = $collection AND NOT related IN hits
+        RETURN d.vector_id as vector_id, d.name as document, d.content as content, 
                collect(distinct t.name) as topics,
                collect(distinct related.content) as related_documents
         """
         
-        graph_results = self.graph.run_query(cypher_query, {"contents": doc_contents})
+        graph_results = self.graph.run_query(
+            cypher_query, {"collection": self.collection, "ids": vector_ids}, stream=True
+        )
+        
+        # Index graph results by vector ID so each vector result is a single lookup;
+        # the uniqueness constraint guarantees one row per ID within the collection
+        graph_by_id = {graph_result["vector_id"]: graph_result for graph_result in graph_results}
         
         # Combine vector and graph results
         enriched_results = []
         for vec_result in vector_results:
-            for graph_result in graph_results:
-                if vec_result["text"] == graph_result["content"]:
-                    enriched_results.append({
-                        "document": graph_result["document"],
-                        "content": graph_result["content"],
-                        "score": vec_result["score"],
-                        "topics": graph_result["topics"],
-                        "related_documents": graph_result["related_documents"]
-                    })
-                    break
+            graph_result = graph_by_id.get(vec_result["id"])
+            if graph_result is not None:
+                enriched_results.append({
+                    "document": graph_result["document"],
+                    "content": graph_result["content"],
+                    "score": vec_result["score"],
+                    "topics": graph_result["topics"],
+                    "related_documents": graph_result["related_documents"]
+                })
         
         return enriched_results
 
-# Initialize the hybrid search engine
-hybrid_search = HybridSearchEngine(vector_collection="hybrid_search_demo")
+if __name__ == "__main__":
+    # Initialize the hybrid search engine
+    hybrid_search = HybridSearchEngine(vector_collection="hybrid_search_demo", recreate=True)
 
-# Add documents with topics
-docs = [
-    {"text": "Python is a high-level programming language known for its readability and versatility.", 
-     "name": "Python Introduction", "topics": ["Programming Languages", "Python"]},
-    {"text": "JavaScript is primarily used for web development and runs in browsers.", 
-     "name": "JavaScript Basics", "topics": ["Programming Languages", "JavaScript", "Web Development"]},
-    {"text": "Machine learning models learn patterns from data without explicit programming.", 
-     "name": "ML Fundamentals", "topics": ["Machine Learning", "Data Science"]},
-    {"text": "Neural networks consist of layers of interconnected nodes or 'neurons'.", 
-     "name": "Neural Network Architecture", "topics": ["Machine Learning", "Neural Networks"]},
-    {"text": "Python is widely used in data science and machine learning applications.", 
-     "name": "Python in Data Science", "topics": ["Python", "Data Science"]}
-]
+    # Add documents with topics
+    docs = [
+        {"text": "Python is a high-level programming language known for its readability and versatility.", 
+         "name": "Python Introduction", "topics": ["Programming Languages", "Python"]},
+        {"text": "JavaScript is primarily used for web development and runs in browsers.", 
+         "name": "JavaScript Basics", "topics": ["Programming Languages", "JavaScript", "Web Development"]},
+        {"text": "Machine learning models learn patterns from data without explicit programming.", 
+         "name": "ML Fundamentals", "topics": ["Machine Learning", "Data Science"]},
+        {"text": "Neural networks consist of layers of interconnected nodes or 'neurons'.", 
+         "name": "Neural Network Architecture", "topics": ["Machine Learning", "Neural Networks"]},
+        {"text": "Python is widely used in data science and machine learning applications.", 
+         "name": "Python in Data Science", "topics": ["Python", "Data Science"]}
+    ]
 
-# Add documents and create topic connections
-for doc in docs:
-    # Add document
-    _, doc_node = hybrid_search.add_document(doc["text"], {"name": doc["name"]})
-    
-    # Add topics and connect document to topics
-    for topic_name in doc["topics"]:
-        # Check if topic exists, create if not
-        topic = hybrid_search.graph.get_entity_by_name("Topic", topic_name)
-        if not topic:
-            topic = hybrid_search.add_topic(topic_name)
-        
-        # Connect document to topic
-        hybrid_search.graph.create_relationship(doc_node, "COVERS", topic)
+    # Add documents and create topic connections in one batch
+    hybrid_search.add_documents_bulk(docs)
 
-print("Hybrid search engine populated with documents and topics")
+    print("Hybrid search engine populated with documents and topics")
 
-# Perform a hybrid search
-query = "How is Python used in machine learning?"
-results = hybrid_search.search(query, top_k=2)
+    # Perform a hybrid search
+    query = "How is Python used in machine learning?"
+    results = hybrid_search.search(query, top_k=2)
 
-print(f"\nQuery: {query}")
-for i, result in enumerate(results):
-    print(f"\nResult {i+1}: {result['document']} (Score: {result['score']:.4f})")
-    print(f"Content: {result['content']}")
-    print(f"Topics: {', '.join(result['topics'])}")
-    if result['related_documents']:
-        print("Related documents:")
-        for j, related in enumerate(result['related_documents']):
-            print(f"  {j+1}. {related}")
\ No newline at end of file
+    print(f"\nQuery: {query}")
+    for i, result in enumerate(results):
+        print(f"\nResult {i+1}: {result['document']} (Score: {result['score']:.4f})")
+        print(f"Content: {result['content']}")
+        print(f"Topics: {', '.join(result['topics'])}")
+        if result['related_documents']:
+            print("Related documents:")
+            for j, related in enumerate(result['related_documents']):
+                print(f"  {j+1}. {related}")
\ No newline at end of file
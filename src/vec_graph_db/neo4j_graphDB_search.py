@@ -1,46 +1,148 @@
+from contextlib import contextmanager
+import logging
 from neo4j import GraphDatabase
 import uuid
 ### Creating a Knowledge Graph class for a Semantic Search System
 
+logger = logging.getLogger(__name__)
+
+# Label/property pairs used in lookups and in HybridSearchEngine.search, so they get an index
+INDEXED_PROPERTIES = [
+    ("Document", "uuid"),
+    ("Document", "name"),
+    ("Topic", "uuid"),
+    ("Topic", "name"),
+    ("User", "uuid"),
+    ("User", "name"),
+    ("Query", "uuid"),
+    ("Query", "name"),
+    ("Intent", "uuid"),
+    ("Intent", "name"),
+]
+
+# Property keys that must be unique per label; the constraint is backed by an index.
+# Milvus IDs are only unique within one collection, so documents are keyed on both.
+UNIQUE_PROPERTIES = [
+    ("Document", ("collection", "vector_id")),
+]
+
+def new_uuid():
+    # The one uuid format for every node in the graph (hyphenated uuid4)
+    return str(uuid.uuid4())
+
 class KnowledgeGraph:
-    def __init__(self, uri="bolt://localhost:7687", user="neo4j", password="password"):
+    def __init__(self, uri="bolt://localhost:7687", user="neo4j", password="password", database="neo4j",
+                 debug_profile=False):
         self.driver = GraphDatabase.driver(uri, auth=(user, password))
+        self.database = database
+        # When set, every query runs under PROFILE and its plan is logged
+        self.debug_profile = debug_profile
+        self.ensure_indexes()
+    
+    def ensure_indexes(self):
+        # Turn label scans on lookups into index seeks
+        for label, prop in INDEXED_PROPERTIES:
+            query = f"""
+            CREATE INDEX {label.lower()}_{prop} IF NOT EXISTS
+            FOR (e:{label}) ON (e.{prop})
+            """
+            self.run_query(query, profile=False)
+        for label, props in UNIQUE_PROPERTIES:
+            keys = ", ".join(f"e.{prop}" for prop in props)
+            query = f"""
+            CREATE CONSTRAINT {label.lower()}_{'_'.join(props)} IF NOT EXISTS
+            FOR (e:{label}) REQUIRE ({keys}) IS UNIQUE
+            """
+            self.run_query(query, profile=False)
     
     def close(self):
         self.driver.close()
     
-    def run_query(self, query, parameters=None):
-        with self.driver.session() as session:
+    def run_query(self, query, parameters=None, stream=False, tx=None, profile=None):
+        # Prefix with PROFILE to check whether the planner seeks an index or scans a label
+        if profile is None:
+            profile = self.debug_profile
+        if profile:
+            query = "PROFILE " + query
+        
+        # Run inside the caller's transaction when one is given (see batch())
+        if tx is not None:
+            result = tx.run(query, parameters or {})
+            records = list(result)
+            if profile:
+                self._log_profile(query, result.consume())
+            return records
+        # With stream=True, return a lazy iterator over the records instead of a list
+        if stream:
+            return self._stream_query(query, parameters, profile)
+        records, summary, _ = self.driver.execute_query(query, parameters or {}, database_=self.database)
+        if profile:
+            self._log_profile(query, summary)
+        return records
+    
+    def _stream_query(self, query, parameters=None, profile=False):
+        # Keep the session open until the caller has consumed every record
+        with self.driver.session(database=self.database) as session:
             result = session.run(query, parameters or {})
-            return [record for record in result]
+            yield from result
+            if profile:
+                self._log_profile(query, result.consume())
+    
+    def _log_profile(self, query, summary):
+        logger.info("Query plan for %s\n%s", query.strip(), summary.profile)
+    
+    @contextmanager
+    def batch(self):
+        # Share one session and transaction across many writes; commits once on exit
+        with self.driver.session(database=self.database) as session:
+            with session.begin_transaction() as tx:
+                yield tx
+                tx.commit()
     
     def clear_database(self):
         query = "MATCH (n) DETACH DELETE n"
         self.run_query(query)
         print("Database cleared")
     
-    def create_entity(self, entity_type, name, properties=None):
+    def create_entity(self, entity_type, name, properties=None, tx=None):
         props = properties or {}
         props['name'] = name
-        props['uuid'] = str(uuid.uuid4())  # Generate a unique identifier for the entity
+        props['uuid'] = new_uuid()  # Generate a unique identifier for the entity
         
         query = f"""
         CREATE (e:{entity_type} $props)
         RETURN e
         """
-        result = self.run_query(query, {"props": props})
+        result = self.run_query(query, {"props": props}, tx=tx)
         return result[0]['e']
     
+    def create_entities_bulk(self, entity_type, rows, tx=None):
+        # Create one node per row (each row is a property map with a "name") in a single UNWIND
+        rows = [dict(row, uuid=new_uuid()) for row in rows]
+        
+        query = f"""
+        UNWIND $rows AS r
+        CREATE (e:{entity_type})
+        SET e = r
+        RETURN e
+        """
+        result = self.run_query(query, {"rows": rows}, tx=tx)
+        return [record['e'] for record in result]
+    
     # Older version of create_relationship (deprecated)
     # This method uses Neo4j's internal id() function, 
     # which is not recommended for long-term use.
     
-    def create_relationship(self, from_entity, rel_type, to_entity, properties=None):
+    def create_relationship(self, from_entity, rel_type, to_entity, properties=None,
+                            from_label=None, to_label=None, tx=None):
         props = properties or {}
         
+        # Label-scoped matches let the planner seek the per-label uuid index
+        from_label = from_label or next(iter(from_entity.labels))
+        to_label = to_label or next(iter(to_entity.labels))
+        
         query = f"""
-        MATCH (a), (b)
-        WHERE a.uuid = $from_id AND b.uuid = $to_id
+        MATCH (a:{from_label} {{uuid: $from_id}}), (b:{to_label} {{uuid: $to_id}})
         CREATE (a)-[r:{rel_type} $props]->(b)
         RETURN r
         """
@@ -48,9 +150,25 @@ class KnowledgeGraph:
             "from_id": from_entity["uuid"],
             "to_id": to_entity["uuid"],
             "props": props
-        })
+        }, tx=tx)
         return result[0]['r']
     
+    def upsert_covers(self, doc_uuid, topic_name, tx=None):
+        # Get-or-create the topic and link the document in one round trip
+        query = """
+        MATCH (d:Document {uuid: $doc_uuid})
+        MERGE (t:Topic {name: $topic_name})
+        ON CREATE SET t.uuid = $topic_uuid
+        MERGE (d)-[r:COVERS]->(t)
+        RETURN t
+        """
+        result = self.run_query(query, {
+            "doc_uuid": doc_uuid,
+            "topic_name": topic_name,
+            "topic_uuid": new_uuid()
+        }, tx=tx)
+        return result[0]['t'] if result else None
+    
     def get_entity_by_name(self, entity_type, name):
         query = f"""
         MATCH (e:{entity_type} {{name: $name}})
@@ -69,147 +187,178 @@ class KnowledgeGraph:
         """
         return self.run_query(query, {"entity_id": entity["uuid"]})
     
-    def find_path_between_entities(self, from_name, from_type, to_name, to_type, max_depth=3):
+    def find_path_between_entities(self, from_name, from_type, to_name, to_type, max_depth=3, rel_types=None):
+        # Bounded BFS via APOC: stops at the target and never revisits a node.
+        # rel_types uses APOC filter syntax, e.g. ["COVERS>", "<ABOUT"]; None allows any type.
         query = f"""
-        MATCH path = shortestPath(
-            (a:{from_type} {{name: $from_name}})-[*..{max_depth}]-(b:{to_type} {{name: $to_name}})
-        )
+        MATCH (a:{from_type} {{name: $from_name}}), (b:{to_type} {{name: $to_name}})
+        CALL apoc.path.expandConfig(a, {{
+            relationshipFilter: $rels,
+            maxLevel: $max_depth,
+            terminatorNodes: [b],
+            uniqueness: 'NODE_GLOBAL',
+            bfs: true
+        }}) YIELD path
         RETURN path
+        LIMIT 1
         """
-        return self.run_query(query, {"from_name": from_name, "to_name": to_name})
-
-# Connect to Neo4j
-kg = KnowledgeGraph()
-
-# Clear the database to start fresh
-kg.clear_database()
-
-### Adding Sample Entities and Relationships, normallly these would be loaded from a database or created dynamically
-# Create entity types (nodes)
-user1 = kg.create_entity("User", "John", {"age": 28, "occupation": "Software Engineer"})
-user2 = kg.create_entity("User", "Alice", {"age": 35, "occupation": "Data Scientist"})
-
-# Create documents
-doc1 = kg.create_entity("Document", "Introduction to Machine Learning", {
-    "content": "Machine learning is a subset of AI focused on learning from data.",
-    "vector_id": 1  # Reference to the vector in Milvus
-})
-
-doc2 = kg.create_entity("Document", "Neural Networks Explained", {
-    "content": "Neural networks are inspired by the human brain's structure.",
-    "vector_id": 2
-})
-
-doc3 = kg.create_entity("Document", "Introduction to Deep Learning", {
-    "content": "Deep learning uses multiple layers of neural networks for complex tasks.",
-    "vector_id": 3
-})
-
-# Create topics
-topic1 = kg.create_entity("Topic", "Machine Learning")
-topic2 = kg.create_entity("Topic", "Neural Networks")
-topic3 = kg.create_entity("Topic", "Deep Learning")
-
-# Create intents
-learn_intent = kg.create_entity("Intent", "Learning", {"description": "User wants to learn about a topic"})
-compare_intent = kg.create_entity("Intent", "Comparison", {"description": "User wants to compare concepts"})
-
-# Create queries
-query1 = kg.create_entity("Query", "How do neural networks work?", {
-    "timestamp": "2023-06-01T10:30:00", 
-    "vector_id": 101  # Reference to query vector in Milvus
-})
-
-query2 = kg.create_entity("Query", "Difference between ML and deep learning?", {
-    "timestamp": "2023-06-02T14:45:00",
-    "vector_id": 102
-})
-
-# Create relationships
-# User-Query relationships
-kg.create_relationship(user1, "SEARCHED", query1, {"timestamp": "2023-06-01T10:30:00"})
-kg.create_relationship(user2, "SEARCHED", query2, {"timestamp": "2023-06-02T14:45:00"})
-
-# Query-Intent relationships
-kg.create_relationship(query1, "HAS_INTENT", learn_intent)
-kg.create_relationship(query2, "HAS_INTENT", compare_intent)
-
-# Query-Topic relationships
-kg.create_relationship(query1, "ABOUT", topic2)  # neural networks
-kg.create_relationship(query2, "ABOUT", topic1)  # machine learning
-kg.create_relationship(query2, "ABOUT", topic3)  # deep learning
-
-# Document-Topic relationships
-kg.create_relationship(doc1, "COVERS", topic1)  # ML document covers ML topic
-kg.create_relationship(doc2, "COVERS", topic2)  # NN document covers NN topic
-kg.create_relationship(doc3, "COVERS", topic3)  # DL document covers DL topic
-kg.create_relationship(doc3, "REFERENCES", topic2)  # DL document references NN topic
-
-# Query-Document relationships (based on search results)
-kg.create_relationship(query1, "RETURNED", doc2, {"rank": 1, "score": 0.92})
-kg.create_relationship(query1, "RETURNED", doc3, {"rank": 2, "score": 0.78})
-kg.create_relationship(query2, "RETURNED", doc1, {"rank": 1, "score": 0.85})
-kg.create_relationship(query2, "RETURNED", doc3, {"rank": 2, "score": 0.82})
-
-# User-Document interactions
-kg.create_relationship(user1, "VIEWED", doc2, {"timestamp": "2023-06-01T10:32:00", "duration": 120})
-kg.create_relationship(user2, "VIEWED", doc1, {"timestamp": "2023-06-02T14:47:00", "duration": 90})
-kg.create_relationship(user2, "BOOKMARKED", doc3, {"timestamp": "2023-06-02T15:10:00"})
-
-print("Knowledge graph created successfully")
-
-
-### Querying the Knowledge Graph for Enhanced Search
-
-# Find documents about Neural Networks
-query = """
-MATCH (d:Document)-[:COVERS]->(t:Topic {name: 'Neural Networks'})
-RETURN d.name as document, d.content as content
-"""
-results = kg.run_query(query)
-print("Documents about Neural Networks:")
-for record in results:
-    print(f"- {record['document']}: {record['content']}")
-
-# Find what topics a specific query was about
-query = """
-MATCH (q:Query {name: 'Difference between ML and deep learning?'})-[:ABOUT]->(t:Topic)
-RETURN q.name as query, collect(t.name) as topics
-"""
-results = kg.run_query(query)
-for record in results:
-    print(f"\nQuery '{record['query']}' is about topics: {', '.join(record['topics'])}")
-
-# Find documents returned for a specific intent
-query = """
-MATCH (q:Query)-[:HAS_INTENT]->(i:Intent {name: 'Learning'}),
-      (q)-[r:RETURNED]->(d:Document)
-RETURN i.name as intent, q.name as query, d.name as document, r.score as score
-ORDER BY r.score DESC
-"""
-results = kg.run_query(query)
-print("\nDocuments returned for 'Learning' intent:")
-for record in results:
-    print(f"- Query: '{record['query']}' → Document: '{record['document']}' (Score: {record['score']})")
-
-# Find user search patterns
-query = """
-MATCH (u:User)-[:SEARCHED]->(q:Query)-[:ABOUT]->(t:Topic)
-RETURN u.name as user, collect(distinct t.name) as topics_of_interest
-"""
-results = kg.run_query(query)
-print("\nUser interests based on search queries:")
-for record in results:
-    print(f"- {record['user']} is interested in: {', '.join(record['topics_of_interest'])}")
-
-# Find relationships between topics
-query = """
-MATCH (d:Document)-[:COVERS]->(t1:Topic),
-      (d)-[:REFERENCES]->(t2:Topic)
-WHERE t1 <> t2
-RETURN t1.name as topic, t2.name as related_topic, d.name as connecting_document
-"""
-results = kg.run_query(query)
-print("\nRelationships between topics:")
-for record in results:
-    print(f"- {record['topic']} is related to {record['related_topic']} via document '{record['connecting_document']}'")
\ No newline at end of file
+        return self.run_query(query, {
+            "from_name": from_name,
+            "to_name": to_name,
+            "rels": "|".join(rel_types or []),
+            "max_depth": max_depth
+        })
+
+if __name__ == "__main__":
+    # Connect to Neo4j
+    kg = KnowledgeGraph()
+
+    # Clear the database to start fresh
+    kg.clear_database()
+
+    ### Adding Sample Entities and Relationships, normallly these would be loaded from a database or created dynamically
+    # Create entity types (nodes), one UNWIND per label
+    user1, user2 = kg.create_entities_bulk("User", [
+        {"name": "John", "age": 28, "occupation": "Software Engineer"},
+        {"name": "Alice", "age": 35, "occupation": "Data Scientist"}
+    ])
+
+    # Create documents
+    doc1, doc2, doc3 = kg.create_entities_bulk("Document", [
+        {
+            "name": "Introduction to Machine Learning",
+            "content": "Machine learning is a subset of AI focused on learning from data.",
+            "vector_id": 1  # Reference to the vector in Milvus
+        },
+        {
+            "name": "Neural Networks Explained",
+            "content": "Neural networks are inspired by the human brain's structure.",
+            "vector_id": 2
+        },
+        {
+            "name": "Introduction to Deep Learning",
+            "content": "Deep learning uses multiple layers of neural networks for complex tasks.",
+            "vector_id": 3
+        }
+    ])
+
+    # Create topics
+    topic1, topic2, topic3 = kg.create_entities_bulk("Topic", [
+        {"name": "Machine Learning"},
+        {"name": "Neural Networks"},
+        {"name": "Deep Learning"}
+    ])
+
+    # Create intents
+    learn_intent, compare_intent = kg.create_entities_bulk("Intent", [
+        {"name": "Learning", "description": "User wants to learn about a topic"},
+        {"name": "Comparison", "description": "User wants to compare concepts"}
+    ])
+
+    # Create queries
+    query1, query2 = kg.create_entities_bulk("Query", [
+        {
+            "name": "How do neural networks work?",
+            "timestamp": "2023-06-01T10:30:00",
+            "vector_id": 101  # Reference to query vector in Milvus
+        },
+        {
+            "name": "Difference between ML and deep learning?",
+            "timestamp": "2023-06-02T14:45:00",
+            "vector_id": 102
+        }
+    ])
+
+    # Create relationships in a single transaction
+    with kg.batch() as tx:
+        # User-Query relationships
+        kg.create_relationship(user1, "SEARCHED", query1, {"timestamp": "2023-06-01T10:30:00"}, tx=tx)
+        kg.create_relationship(user2, "SEARCHED", query2, {"timestamp": "2023-06-02T14:45:00"}, tx=tx)
+
+        # Query-Intent relationships
+        kg.create_relationship(query1, "HAS_INTENT", learn_intent, tx=tx)
+        kg.create_relationship(query2, "HAS_INTENT", compare_intent, tx=tx)
+
+        # Query-Topic relationships
+        kg.create_relationship(query1, "ABOUT", topic2, tx=tx)  # neural networks
+        kg.create_relationship(query2, "ABOUT", topic1, tx=tx)  # machine learning
+        kg.create_relationship(query2, "ABOUT", topic3, tx=tx)  # deep learning
+
+        # Document-Topic relationships
+        kg.create_relationship(doc1, "COVERS", topic1, tx=tx)  # ML document covers ML topic
+        kg.create_relationship(doc2, "COVERS", topic2, tx=tx)  # NN document covers NN topic
+        kg.create_relationship(doc3, "COVERS", topic3, tx=tx)  # DL document covers DL topic
+        kg.create_relationship(doc3, "REFERENCES", topic2, tx=tx)  # DL document references NN topic
+
+        # Query-Document relationships (based on search results)
+        kg.create_relationship(query1, "RETURNED", doc2, {"rank": 1, "score": 0.92}, tx=tx)
+        kg.create_relationship(query1, "RETURNED", doc3, {"rank": 2, "score": 0.78}, tx=tx)
+        kg.create_relationship(query2, "RETURNED", doc1, {"rank": 1, "score": 0.85}, tx=tx)
+        kg.create_relationship(query2, "RETURNED", doc3, {"rank": 2, "score": 0.82}, tx=tx)
+
+        # User-Document interactions
+        kg.create_relationship(user1, "VIEWED", doc2, {"timestamp": "2023-06-01T10:32:00", "duration": 120}, tx=tx)
+        kg.create_relationship(user2, "VIEWED", doc1, {"timestamp": "2023-06-02T14:47:00", "duration": 90}, tx=tx)
+        kg.create_relationship(user2, "BOOKMARKED", doc3, {"timestamp": "2023-06-02T15:10:00"}, tx=tx)
+
+    print("Knowledge graph created successfully")
+
+
+    ### Querying the Knowledge Graph for Enhanced Search
+
+    # Run every report in one round trip; each CALL subquery aggregates its rows with collect()
+    query = """
+    CALL {
+        MATCH (d:Document)-[:COVERS]->(t:Topic {name: 'Neural Networks'})
+        RETURN collect({document: d.name, content: d.content}) as nn_documents
+    }
+    CALL {
+        MATCH (q:Query {name: 'Difference between ML and deep learning?'})-[:ABOUT]->(t:Topic)
+        WITH q, collect(t.name) as topics
+        RETURN collect({query: q.name, topics: topics}) as query_topics
+    }
+    CALL {
+        MATCH (q:Query)-[:HAS_INTENT]->(i:Intent {name: 'Learning'}),
+              (q)-[r:RETURNED]->(d:Document)
+        WITH i, q, d, r
+        ORDER BY r.score DESC
+        RETURN collect({intent: i.name, query: q.name, document: d.name, score: r.score}) as intent_documents
+    }
+    CALL {
+        MATCH (u:User)-[:SEARCHED]->(q:Query)-[:ABOUT]->(t:Topic)
+        WITH u, collect(distinct t.name) as topics_of_interest
+        RETURN collect({user: u.name, topics_of_interest: topics_of_interest}) as user_interests
+    }
+    CALL {
+        MATCH (d:Document)-[:COVERS]->(t1:Topic),
+              (d)-[:REFERENCES]->(t2:Topic)
+        WHERE t1 <> t2
+        RETURN collect({topic: t1.name, related_topic: t2.name, connecting_document: d.name}) as topic_relationships
+    }
+    RETURN nn_documents, query_topics, intent_documents, user_interests, topic_relationships
+    """
+    report = kg.run_query(query)[0]
+
+    # Find documents about Neural Networks
+    print("Documents about Neural Networks:")
+    for record in report["nn_documents"]:
+        print(f"- {record['document']}: {record['content']}")
+
+    # Find what topics a specific query was about
+    for record in report["query_topics"]:
+        print(f"\nQuery '{record['query']}' is about topics: {', '.join(record['topics'])}")
+
+    # Find documents returned for a specific intent
+    print("\nDocuments returned for 'Learning' intent:")
+    for record in report["intent_documents"]:
+        print(f"- Query: '{record['query']}' → Document: '{record['document']}' (Score: {record['score']})")
+
+    # Find user search patterns
+    print("\nUser interests based on search queries:")
+    for record in report["user_interests"]:
+        print(f"- {record['user']} is interested in: {', '.join(record['topics_of_interest'])}")
+
+    # Find relationships between topics
+    print("\nRelationships between topics:")
+    for record in report["topic_relationships"]:
+        print(f"- {record['topic']} is related to {record['related_topic']} via document '{record['connecting_document']}'")
\ No newline at end of file
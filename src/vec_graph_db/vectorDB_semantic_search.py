@@ -1,4 +1,14 @@
+import atexit
+import functools
+import hashlib
+import math
+import os
+import threading
+import warnings
+from concurrent.futures import ThreadPoolExecutor, wait
+import torch
 from sentence_transformers import SentenceTransformer
+from sentence_transformers.util import batch_to_device
 import numpy as np
 from pymilvus import (
     connections,
@@ -9,23 +19,333 @@ from pymilvus import (
     Collection
 )
 
+try:
+    import numba
+except ImportError:
+    numba = None
+
+if numba is not None:
+    @numba.njit(parallel=True, fastmath=True, cache=True)
+    def _normalize_2d(x):
+        # L2-normalize each row in place, one row per thread
+        for i in numba.prange(x.shape[0]):
+            s = 0.0
+            for j in range(x.shape[1]):
+                s += x[i, j] * x[i, j]
+            if s > 0.0:
+                inv = 1.0 / math.sqrt(s)
+                for j in range(x.shape[1]):
+                    x[i, j] *= inv
+        return x
+    
+    # Compile once at import so the first insert doesn't pay the JIT cost
+    _normalize_2d(np.zeros((1, 1), dtype=np.float32))
+else:
+    def _normalize_2d(x):
+        # L2-normalize each row in place
+        norms = np.linalg.norm(x, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        x /= norms
+        return x
+
+# Sentences used to check that a quantized encoder still matches the FP32 one
+_QUANTIZATION_CHECK_SENTENCES = [
+    "Blockchain is a distributed ledger technology enabling secure transactions.",
+    "Cloud computing delivers computing services over the internet on-demand.",
+    "How does cloud technology work?",
+    "Python is widely used in data science and machine learning applications.",
+    "Neural networks consist of layers of interconnected nodes or 'neurons'.",
+    "JavaScript is primarily used for web development and runs in browsers.",
+    "Difference between ML and deep learning?",
+    "Virtual Reality (VR) creates immersive digital environments for users.",
+    "Cybersecurity protects systems and data from digital attacks.",
+    "What is the capital of France?",
+]
+
+def _num_threads():
+    # Size intra-op thread pools (torch's OpenMP/MKL, ONNX Runtime) to physical
+    # cores, not SMT threads, of the CPUs this process may run on;
+    # SBERT_THREADS overrides the guess
+    if hasattr(os, "sched_getaffinity"):
+        cpus = len(os.sched_getaffinity(0))
+    else:
+        cpus = os.cpu_count()
+    return int(os.environ.get("SBERT_THREADS", max(cpus // 2, 1)))
+
+def pin_to_cores(cores):
+    # Restrict the WHOLE process to the given cores (e.g. the performance cores
+    # of a hybrid CPU). Linux only. sched_setaffinity(0) would only pin the
+    # calling thread, so every existing thread (numba and OpenMP workers
+    # included) is pinned; threads started later inherit the mask. Call it
+    # before creating engines so their thread pools are sized to the cores.
+    if not hasattr(os, "sched_setaffinity"):
+        return
+    cores = set(cores) & os.sched_getaffinity(0)
+    if not cores:
+        return
+    for tid in os.listdir("/proc/self/task"):
+        try:
+            os.sched_setaffinity(int(tid), cores)
+        except ProcessLookupError:
+            # The thread exited since the listing
+            pass
+
+@functools.lru_cache(maxsize=4)
+def _load_model(model_name, device, fp16, encoder_backend="torch", quantize=False, compile_model=False):
+    # Share loaded weights and tokenizer between engines in the same process
+    if encoder_backend == "onnx":
+        return _load_onnx_model(model_name, device, quantize)
+    model = SentenceTransformer(model_name, device=device)
+    model.eval()
+    if fp16:
+        model.half()
+    if compile_model:
+        # Fuse the transformer into one inductor graph to cut Python dispatch overhead;
+        # warm it up here so the first real query doesn't pay the compile
+        model[0].auto_model = torch.compile(model[0].auto_model, mode="reduce-overhead", dynamic=True)
+        with torch.inference_mode():
+            model.encode(["warmup"], show_progress_bar=False)
+    return model
+
+def _load_onnx_model(model_name, device, quantize=False):
+    # Run the encoder on ONNX Runtime with full graph optimization (fused
+    # MatMul/Add/GELU, constant folding); the export is cached under ./onnx
+    import onnxruntime as ort
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    
+    session_options = ort.SessionOptions()
+    session_options.intra_op_num_threads = _num_threads()
+    session_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    provider = "CUDAExecutionProvider" if device == "cuda" else "CPUExecutionProvider"
+    model_kwargs = {"provider": provider, "session_options": session_options}
+    
+    onnx_dir = os.path.join("onnx", model_name.replace("/", "__"))
+    if os.path.exists(os.path.join(onnx_dir, "onnx", "model.onnx")):
+        model = SentenceTransformer(onnx_dir, device=device, backend="onnx", model_kwargs=model_kwargs)
+    else:
+        # First use: export (or download) the ONNX graph and keep it for next time
+        model = SentenceTransformer(model_name, device=device, backend="onnx", model_kwargs=model_kwargs)
+        model.save_pretrained(onnx_dir)
+    if not quantize or provider != "CPUExecutionProvider":
+        return model
+    
+    # Dynamic INT8 quantization of the MatMul weights; on VNNI-capable CPUs
+    # ONNX Runtime runs these as int8 dot products
+    int8_file = os.path.join("onnx", "model_qint8.onnx")
+    int8_path = os.path.join(onnx_dir, int8_file)
+    validate = not os.path.exists(int8_path)
+    if validate:
+        quantize_dynamic(
+            os.path.join(onnx_dir, "onnx", "model.onnx"),
+            int8_path,
+            weight_type=QuantType.QInt8,
+            op_types_to_quantize=["MatMul"]
+        )
+    int8_model = SentenceTransformer(onnx_dir, device=device, backend="onnx",
+                                     model_kwargs=dict(model_kwargs, file_name=int8_file))
+    
+    # Check a freshly quantized graph against FP32 once; keep FP32 if quality drops
+    if validate:
+        reference = model.encode(_QUANTIZATION_CHECK_SENTENCES, normalize_embeddings=True)
+        quantized = int8_model.encode(_QUANTIZATION_CHECK_SENTENCES, normalize_embeddings=True)
+        similarity = float(np.min(np.sum(reference * quantized, axis=1)))
+        if similarity < 0.99:
+            os.remove(int8_path)
+            warnings.warn(f"INT8 encoder diverges from FP32 (min cosine {similarity:.4f}); using FP32")
+            return model
+    return int8_model
+
+def _to_unit_float32(embeddings):
+    # Contiguous float32 rows with unit length; fp16 models return float16
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    return _normalize_2d(embeddings)
+
+def auto_tune_hnsw(num_vectors):
+    # Pick HNSW build/search parameters for the expected corpus size.
+    # Larger graphs need more links per node and a wider candidate list
+    # to keep recall up without visiting many more vectors per query.
+    # M=16/efConstruction=200 is the commonly benchmarked sweet spot; validate
+    # recall on a held-out set, as some distributions cliff at certain values.
+    if num_vectors < 100_000:
+        return {"M": 16, "efConstruction": 200, "ef": 64}
+    if num_vectors < 1_000_000:
+        return {"M": 24, "efConstruction": 200, "ef": 100}
+    return {"M": 32, "efConstruction": 200, "ef": 200}
+
+def auto_tune_ivf(num_vectors):
+    # Pick IVF cluster count and probe width for the expected corpus size.
+    # IVF rebuilds in seconds and keeps inserts cheap, which suits
+    # ingestion-heavy workloads better than incremental HNSW maintenance.
+    nlist = max(int(2 * num_vectors ** 0.5), 20)
+    nprobe = max(min(nlist // 4, 10), 1)
+    return {"nlist": nlist, "nprobe": nprobe}
+
 class SemanticSearchEngine:
-    def __init__(self, model_name="all-MiniLM-L6-v2", collection_name="semantic_search"):
-        # Load the sentence transformer model
-        self.model = SentenceTransformer(model_name)
+    def __init__(self, model_name="all-MiniLM-L6-v2", collection_name="semantic_search",
+                 expected_num_vectors=0, index_type="HNSW_SQ", hnsw_m=None, hnsw_ef_construction=None,
+                 ef_search=None, nlist=None, nprobe=None, sq_type="SQ8", batch_size=64, device=None, fp16=False,
+                 backend="milvus", insert_batch_size=1000, encoder_backend="torch", quantize=True,
+                 query_cache_size=1024, semantic_cache_threshold=None, semantic_cache_size=512,
+                 recreate=False, pca_dim=None, compile_model=False, brute_force_threshold=10_000,
+                 embedding_cache_dir=None, trace_seq_length=None, pca_dir=None):
+        # Load the sentence transformer model, on GPU when one is available
+        if device is None:
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+        # encoder_backend="onnx" swaps PyTorch for ONNX Runtime behind the same encode() API;
+        # quantize then uses the INT8 version of that graph
+        self.model_name = model_name
+        self.device = device
+        self.fp16 = fp16 and device != "cpu"
+        self.encoder_backend = encoder_backend
+        self.compile_model = compile_model and encoder_backend == "torch"
+        # Dynamic INT8 only pays off on CPUExecutionProvider; on CUDA its
+        # MatMulInteger/DynamicQuantizeLinear nodes fall back to the CPU
+        self.quantize = quantize and encoder_backend == "onnx" and device == "cpu"
+        if quantize and encoder_backend == "onnx" and device != "cpu":
+            warnings.warn(f"INT8 quantization is CPU-only; using the FP32 ONNX encoder on {device}")
+        self.model = _load_model(model_name, device, self.fp16, encoder_backend,
+                                 self.quantize, self.compile_model)
+        if device == "cpu":
+            torch.set_num_threads(_num_threads())
+        self.batch_size = batch_size
+        self.insert_batch_size = insert_batch_size
+        # Multi-process encode pool for add_documents_bulk, started on first use
+        self._pool = None
+        self._pool_model = None
+        
+        # Optional on-disk cache of document embeddings keyed by content hash, so
+        # re-ingesting unchanged documents skips the encoder. Keys carry the model,
+        # encoder variant and precision so switching any of them never returns
+        # another encoder's vectors.
+        self._emb_cache = None
+        if embedding_cache_dir:
+            import diskcache
+            self._emb_cache = diskcache.Cache(embedding_cache_dir)
+            precision = "int8" if self.quantize else "fp16" if self.fp16 else "fp32"
+            self._emb_cache_namespace = f"{model_name}:{encoder_backend}:{precision}"
         self.collection_name = collection_name
-        self.dim = self.model.get_sentence_embedding_dimension()
+        # model_dim is the encoder's output size; dim is what gets stored (differs with PCA)
+        self.model_dim = self.model.get_sentence_embedding_dimension()
+        self.dim = self.model_dim
+        
+        # Optional PCA head projecting embeddings down to pca_dim before they are
+        # stored or searched; fitted on the first add_documents batch and saved as
+        # <pca_dir>/<collection>.npz so later runs project the same way. pca_dir
+        # defaults to ~/.cache/vec_graph_db/pca, independent of the working directory.
+        self.pca_dim = pca_dim
+        self._pca_components = None
+        self._pca_mean = None
+        pca_dir = pca_dir or os.path.join(os.path.expanduser("~"), ".cache", "vec_graph_db", "pca")
+        self._pca_path = os.path.join(pca_dir, f"{collection_name}.npz")
+        if pca_dim:
+            self.dim = pca_dim
+            if recreate and os.path.exists(self._pca_path):
+                os.remove(self._pca_path)
+            elif os.path.exists(self._pca_path):
+                pca = np.load(self._pca_path)
+                self._pca_components = pca["components"]
+                self._pca_mean = pca["mean"]
+        
+        # Exact-match LRU of query embeddings; repeated queries skip the forward pass
+        self._encode_cached = functools.lru_cache(maxsize=query_cache_size)(self._encode_one)
+        self._query_cache_enabled = query_cache_size != 0
+        
+        # Per-thread reusable buffer the query encoder writes into when the query
+        # cache is off, so an uncached search allocates no per-query embedding
+        # arrays while concurrent searches still each get their own
+        self._q_local = threading.local()
+        
+        # Optional TorchScript trace of the transformer at a fixed sequence length
+        # (e.g. 64): queries that tokenize to at most that many tokens are padded
+        # up and run through the shape-specialized graph, longer ones fall back to
+        # the dynamic model. Torch backend only, and not combined with torch.compile.
+        self._traced = None
+        self._trace_seq_length = trace_seq_length
+        if trace_seq_length and encoder_backend == "torch" and not compile_model:
+            self._traced = self._trace_encoder(trace_seq_length)
+        
+        # Semantic cache: results of recent queries, reused for any new query whose
+        # embedding is within semantic_cache_threshold cosine of a cached one
+        # (off by default, since distinct queries may then share results).
+        # A fixed-size ring buffer, so the oldest entry is evicted first.
+        self.semantic_cache_threshold = semantic_cache_threshold
+        self._cache_embs = np.zeros((semantic_cache_size, self.dim), dtype=np.float32)
+        self._cache_results = [None] * semantic_cache_size
+        self._cache_count = 0
+        self._cache_next = 0
+        self.semantic_cache_hits = 0
+        self.semantic_cache_misses = 0
+        
+        # HNSW parameters, auto-selected by corpus size unless given explicitly
+        hnsw_params = auto_tune_hnsw(expected_num_vectors)
+        self.hnsw_m = hnsw_m or hnsw_params["M"]
+        self.hnsw_ef_construction = hnsw_ef_construction or hnsw_params["efConstruction"]
+        self.ef_search = ef_search or hnsw_params["ef"]
+        
+        # HNSW_SQ stores the graph's vectors quantized (SQ8 by default), while
+        # the field itself stays FLOAT_VECTOR and Milvus quantizes internally
+        self.index_type = index_type
+        self.sq_type = sq_type
+        
+        # Vectors are L2-normalized before insert and search, so inner product
+        # equals cosine without Milvus re-normalizing on every distance
+        self.metric_type = "IP"
+        
+        # IVF parameters, used when index_type is an IVF variant such as IVF_SQ8
+        ivf_params = auto_tune_ivf(expected_num_vectors)
+        self.nlist = nlist or ivf_params["nlist"]
+        self.nprobe = nprobe or ivf_params["nprobe"]
+        
+        # "faiss" keeps an in-process HNSW index for small, single-node corpora
+        # and skips the Milvus RPC stack entirely
+        self.backend = backend
+        if backend == "faiss":
+            import faiss
+            self._faiss = faiss
+            self.index = faiss.IndexHNSWFlat(self.dim, 32, faiss.METRIC_INNER_PRODUCT)
+            self.index.hnsw.efConstruction = 100
+            self.index.hnsw.efSearch = 64
+            self.texts = []
+            return
         
         # Connect to Milvus
         if not connections.has_connection("default"):
             connections.connect("default", host="localhost", port="19530")
         
-        # Create collection if it doesn't exist
-        self._initialize_collection()
+        # Small collections are also mirrored in memory and searched with one
+        # matrix-vector product, which beats an RPC plus HNSW walk below
+        # brute_force_threshold vectors
+        self.brute_force_threshold = brute_force_threshold
+        self._local_embs = np.zeros((0, self.dim), dtype=np.float32)
+        self._local_ids = np.zeros(0, dtype=np.int64)
+        self._local_texts = []
+        
+        # Create collection if it doesn't exist; it is loaded lazily on first search
+        self._loaded = False
+        self._initialize_collection(recreate)
+        # IDs are handed out from a local counter, seeded once here, so inserts
+        # don't need a flush just to keep num_entities current
+        self._next_id = self.collection.num_entities
+        # A reopened collection may hold vectors this process never saw
+        self._local_complete = self._next_id == 0
     
-    def _initialize_collection(self):
-        # Drop existing collection if it exists
+    def _initialize_collection(self, recreate=False):
+        # Reopen an existing collection so its vectors and index survive restarts;
+        # recreate=True drops it and starts from an empty collection
         if utility.has_collection(self.collection_name):
+            if not recreate:
+                self.collection = Collection(self.collection_name)
+                self._check_reopened_dim()
+                self._adopt_index_settings()
+                # Seal rows a previous process left unflushed so num_entities counts them
+                self.collection.flush()
+                if self.pca_dim and self._pca_components is None and self.collection.num_entities:
+                    raise ValueError(
+                        f"Collection {self.collection_name!r} already holds vectors but "
+                        f"{self._pca_path} is missing, so new embeddings can't be projected "
+                        f"the same way; pass recreate=True to rebuild it"
+                    )
+                return
             utility.drop_collection(self.collection_name)
         
         # Define collection schema
@@ -40,93 +360,461 @@ class SemanticSearchEngine:
         self.collection = Collection(name=self.collection_name, schema=schema)
         
         # Create an index for vector field
+        if self.index_type.startswith("IVF"):
+            params = {"nlist": self.nlist}
+        else:
+            params = {"M": self.hnsw_m, "efConstruction": self.hnsw_ef_construction}
+            if self.index_type == "HNSW_SQ":
+                params["sq_type"] = self.sq_type
         index_params = {
-            "metric_type": "COSINE",
-            "index_type": "HNSW",
-            "params": {"M": 8, "efConstruction": 64}
+            "metric_type": self.metric_type,
+            "index_type": self.index_type,
+            "params": params
         }
         self.collection.create_index(field_name="embedding", index_params=index_params)
     
+    def _check_reopened_dim(self):
+        # A collection built without PCA (or with another pca_dim) stores vectors
+        # of a different size; fail here rather than with an opaque Milvus error
+        for field in self.collection.schema.fields:
+            if field.name == "embedding":
+                stored_dim = int(field.params["dim"])
+                if stored_dim != self.dim:
+                    raise ValueError(
+                        f"Collection {self.collection_name!r} stores {stored_dim}-d vectors, "
+                        f"but this engine produces {self.dim}-d ones (pca_dim={self.pca_dim}); "
+                        f"pass recreate=True or use a different collection_name"
+                    )
+                return
+    
+    def _adopt_index_settings(self):
+        # A reopened collection may predate the switch to IP (e.g. a COSINE index);
+        # search must use the metric and index type it was actually built with
+        for index in self.collection.indexes:
+            if index.field_name == "embedding":
+                self.metric_type = index.params.get("metric_type", self.metric_type)
+                self.index_type = index.params.get("index_type", self.index_type)
+                break
+    
+    def _encode_raw(self, texts):
+        # Encode to unit-length float32 rows; sentence-transformers sorts texts by
+        # length before batching, so padding within each batch stays minimal.
+        # inference_mode also skips the autograd version tracking no_grad keeps.
+        with torch.inference_mode():
+            embeddings = self.model.encode(
+                texts,
+                batch_size=self.batch_size,
+                convert_to_numpy=True,
+                show_progress_bar=False
+            )
+        return _to_unit_float32(embeddings)
+    
+    def _encode(self, texts):
+        return self._project(self._encode_raw(texts))
+    
+    def _encode_documents(self, texts):
+        return self._prepare_documents(self._encode_with_disk_cache(texts, self._encode_raw))
+    
+    def _encode_with_disk_cache(self, texts, encode):
+        # encode(texts) returns raw unit-length embeddings; only cache misses reach it
+        if self._emb_cache is None:
+            return encode(texts)
+        
+        keys = [
+            f"{self._emb_cache_namespace}:{hashlib.sha256(text.encode()).hexdigest()}"
+            for text in texts
+        ]
+        embeddings = np.empty((len(texts), self.model_dim), dtype=np.float32)
+        miss_idx = []
+        for i, key in enumerate(keys):
+            cached = self._emb_cache.get(key)
+            if cached is None:
+                miss_idx.append(i)
+            else:
+                embeddings[i] = np.frombuffer(cached, dtype=np.float32)
+        
+        if miss_idx:
+            miss_embeddings = encode([texts[i] for i in miss_idx])
+            embeddings[miss_idx] = miss_embeddings
+            # Stored as raw float32 bytes rather than pickled Python floats
+            for i, embedding in zip(miss_idx, miss_embeddings):
+                self._emb_cache.set(keys[i], embedding.tobytes())
+        return embeddings
+    
+    def _prepare_documents(self, embeddings):
+        # The first documents double as the PCA calibration batch
+        if self.pca_dim and self._pca_components is None:
+            self._fit_pca(embeddings)
+        return self._project(embeddings)
+    
+    def _fit_pca(self, embeddings):
+        from sklearn.decomposition import PCA
+        
+        if len(embeddings) < self.pca_dim:
+            raise ValueError(
+                f"PCA to {self.pca_dim} dimensions needs at least {self.pca_dim} documents "
+                f"in the first add_documents call, got {len(embeddings)}"
+            )
+        pca = PCA(n_components=self.pca_dim).fit(embeddings)
+        self._pca_components = pca.components_.astype(np.float32)
+        self._pca_mean = pca.mean_.astype(np.float32)
+        os.makedirs(os.path.dirname(self._pca_path), exist_ok=True)
+        np.savez(self._pca_path, components=self._pca_components, mean=self._pca_mean)
+    
+    def _project(self, embeddings):
+        if not self.pca_dim:
+            return embeddings
+        if self._pca_components is None:
+            raise RuntimeError("PCA is not fitted yet; add documents before searching")
+        # Re-normalize so inner product is still cosine in the reduced space
+        return _to_unit_float32((embeddings - self._pca_mean) @ self._pca_components.T)
+    
+    def _pad_features(self, features, length):
+        # Right-pad a tokenized batch to length; padded positions are masked out
+        # of attention and pooling, so the embedding is unchanged
+        pad = length - features["input_ids"].shape[1]
+        pad_id = self.model.tokenizer.pad_token_id or 0
+        return {
+            "input_ids": torch.nn.functional.pad(features["input_ids"], (0, pad), value=pad_id),
+            "attention_mask": torch.nn.functional.pad(features["attention_mask"], (0, pad), value=0),
+        }
+    
+    def _trace_encoder(self, seq_length):
+        example = self.model.tokenize(["x" * 10])
+        # Padding can't shorten a sequence; a negative pad would cut off [SEP]
+        # and trace the wrong graph
+        if example["input_ids"].shape[1] > seq_length:
+            raise ValueError(
+                f"trace_seq_length={seq_length} is shorter than the "
+                f"{example['input_ids'].shape[1]}-token tracing example"
+            )
+        example = self._pad_features(example, seq_length)
+        example = batch_to_device(example, self.model.device)
+        with torch.no_grad():
+            return torch.jit.trace(
+                self.model[0].auto_model,
+                (example["input_ids"], example["attention_mask"]),
+                strict=False,
+            )
+    
+    def _forward_traced(self, features):
+        # Transformer step through the traced graph, then the remaining
+        # modules (pooling, normalize) on the padded features as usual
+        features = self._pad_features(features, self._trace_seq_length)
+        output = self._traced(features["input_ids"], features["attention_mask"])
+        features["token_embeddings"] = output["last_hidden_state"]
+        for module in list(self.model)[1:]:
+            features = module(features)
+        return features
+    
+    def _encode_into(self, text, out):
+        # Tokenize and run the forward pass directly, copying the pooled
+        # embedding into out instead of going through encode()'s list/array churn
+        features = batch_to_device(self.model.tokenize([text]), self.model.device)
+        with torch.inference_mode():
+            if self._traced is not None and features["input_ids"].shape[1] <= self._trace_seq_length:
+                features = self._forward_traced(features)
+            else:
+                features = self.model.forward(features)
+            embedding = features["sentence_embedding"]
+        np.copyto(out[0], embedding[0].float().cpu().numpy())
+        return _normalize_2d(out)
+    
+    def _embed_query(self, text):
+        if self._query_cache_enabled:
+            return self._encode_cached(text)
+        return self._project(self._encode_into(text, self._query_buffer()))
+    
+    def _query_buffer(self):
+        buf = getattr(self._q_local, "buf", None)
+        if buf is None:
+            buf = self._q_local.buf = np.empty((1, self.model_dim), dtype=np.float32)
+        return buf
+    
+    def _encode_one(self, text):
+        # Cached arrays live on in the LRU, so each gets its own read-only array
+        embedding = self._project(self._encode_into(text, np.empty((1, self.model_dim), dtype=np.float32)))
+        embedding.flags.writeable = False
+        return embedding
+    
+    def cache_info(self):
+        # Hit/miss counters of the query embedding cache
+        return self._encode_cached.cache_info()
+    
+    def semantic_cache_info(self):
+        # Hit/miss counters of the semantic result cache
+        return {
+            "hits": self.semantic_cache_hits,
+            "misses": self.semantic_cache_misses,
+            "size": self._cache_count
+        }
+    
+    def _semantic_cache_lookup(self, query_embedding, top_k, ef_search):
+        # Vectors are unit length, so the dot product is the cosine similarity
+        if self.semantic_cache_threshold is None or self._cache_count == 0:
+            return None
+        sims = self._cache_embs[:self._cache_count] @ query_embedding[0]
+        best = int(np.argmax(sims))
+        cached_top_k, cached_ef, hit_embs, cached_results = self._cache_results[best]
+        # Results fetched with a narrower ef may miss hits a wider search finds
+        if sims[best] < self.semantic_cache_threshold or cached_top_k < top_k or cached_ef < ef_search:
+            return None
+        # Re-score the cached hits against this query rather than reusing the
+        # cached query's scores, and re-rank by them
+        scores = hit_embs @ query_embedding[0]
+        if self.metric_type == "L2" and not self._searches_locally():
+            # Squared L2 between unit vectors, as Milvus reports it; smaller is closer
+            scores = 2.0 - 2.0 * scores
+            order = np.argsort(scores)
+        else:
+            order = np.argsort(-scores)
+        return [dict(cached_results[i], score=float(scores[i])) for i in order[:top_k]]
+    
+    def _semantic_cache_store(self, query_embedding, top_k, ef_search, hit_embs, results):
+        if self.semantic_cache_threshold is None or len(self._cache_results) == 0:
+            return
+        self._cache_embs[self._cache_next] = query_embedding[0]
+        self._cache_results[self._cache_next] = (top_k, ef_search, hit_embs, [dict(hit) for hit in results])
+        self._cache_next = (self._cache_next + 1) % len(self._cache_results)
+        self._cache_count = min(self._cache_count + 1, len(self._cache_results))
+    
+    def _clear_semantic_cache(self):
+        # Cached results go stale once new documents can outrank them
+        self._cache_count = 0
+        self._cache_next = 0
+    
     def add_documents(self, documents):
-        # Get current count
-        current_count = self.collection.num_entities
+        return self._insert_documents(
+            documents, lambda start, end: self._encode_documents(documents[start:end])
+        )
+    
+    def add_documents_bulk(self, documents, num_workers=4):
+        # Encode across worker processes, sidestepping the GIL for large ingests;
+        # add_documents stays cheaper for small adds
+        if self.encoder_backend != "torch" or self.compile_model:
+            # Workers get a pickled copy of the model, which ONNX Runtime sessions
+            # and torch.compile'd modules don't survive
+            warnings.warn(
+                f"add_documents_bulk needs the eager torch encoder; encoding "
+                f"in-process for encoder_backend={self.encoder_backend!r}, "
+                f"compile_model={self.compile_model}"
+            )
+            return self.add_documents(documents)
+        if self._pool is None:
+            self._start_pool(num_workers)
+        embeddings = self._encode_with_disk_cache(
+            documents,
+            lambda texts: _to_unit_float32(
+                self._pool_model.encode_multi_process(texts, self._pool, batch_size=self.batch_size)
+            )
+        )
+        embeddings = self._prepare_documents(embeddings)
+        return self._insert_documents(documents, lambda start, end: embeddings[start:end], flush=True)
+    
+    def _start_pool(self, num_workers):
+        # Starting a pool moves its model to the CPU, and self.model is shared
+        # with every engine in the process (see _load_model), so the workers get
+        # their own copy; each moves it onto this engine's device
+        self._pool_model = SentenceTransformer(self.model_name, device="cpu")
+        if self.fp16:
+            self._pool_model.half()
+        self._pool = self._pool_model.start_multi_process_pool([self.device] * num_workers)
+        atexit.register(self._pool_model.stop_multi_process_pool, self._pool)
+    
+    def _insert_documents(self, documents, encode, flush=False):
+        # encode(start, end) returns the embeddings for documents[start:end];
+        # flush=True seals the new rows, worth it only for large ingests
+        self._clear_semantic_cache()
         
-        # Generate IDs
-        doc_ids = list(range(current_count, current_count + len(documents)))
+        if self.backend == "faiss":
+            embeddings = encode(0, len(documents))
+            # FAISS numbers vectors in insertion order, so IDs are list positions
+            doc_ids = np.arange(len(self.texts), len(self.texts) + len(documents), dtype=np.int64)
+            self.index.add(embeddings)
+            self.texts.extend(documents)
+            return doc_ids.tolist()
         
-        # Generate embeddings
-        embeddings = self.model.encode(documents).tolist()
+        # Generate IDs as one contiguous int64 buffer that pymilvus can pass through as is.
+        # The range is reserved before any chunk goes out: Milvus doesn't enforce unique
+        # primary keys, so IDs of chunks stored before a failure must never be handed out
+        # again (a failed insert just leaves a gap)
+        doc_ids = np.arange(self._next_id, self._next_id + len(documents), dtype=np.int64)
+        self._next_id += len(documents)
         
-        # Insert data
-        insert_data = [doc_ids, embeddings, documents]
-        self.collection.insert(insert_data)
+        # Encode chunk by chunk while a worker thread inserts the previous chunk,
+        # so Milvus network time hides behind the next encode
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            futures = []
+            mirror_chunks = []
+            try:
+                for start in range(0, len(documents), self.insert_batch_size):
+                    end = min(start + self.insert_batch_size, len(documents))
+                    # Milvus accepts the 2-D numpy array directly
+                    embeddings = encode(start, end)
+                    insert_data = [doc_ids[start:end], embeddings, documents[start:end]]
+                    futures.append(pool.submit(self.collection.insert, insert_data))
+                    # Hold chunks for the in-memory mirror while it can still take them
+                    if self._local_complete and len(self._local_ids) + end <= self.brute_force_threshold:
+                        mirror_chunks.append(embeddings)
+                for future in futures:
+                    future.result()
+            except BaseException:
+                # Some chunks may already be in Milvus but not in the mirror, which
+                # would hide them from brute-force search; search Milvus from now on
+                self._drop_mirror()
+                raise
+        # Only mirror once every chunk is in, so the mirror never covers rows Milvus didn't store
+        self._mirror_locally(doc_ids, mirror_chunks, documents)
         
-        # Load collection to memory for search
+        if flush:
+            self.collection.flush()
+        
+        # Callers (and Neo4j parameters) get plain Python ints
+        return doc_ids.tolist()
+    
+    def _mirror_locally(self, doc_ids, embedding_chunks, documents):
+        if not self._local_complete:
+            return
+        if len(self._local_ids) + len(doc_ids) > self.brute_force_threshold:
+            # Too big for brute force from here on; free the mirror and use Milvus
+            self._drop_mirror()
+            return
+        self._local_embs = np.concatenate([self._local_embs, *embedding_chunks])
+        self._local_ids = np.concatenate([self._local_ids, doc_ids])
+        self._local_texts.extend(documents)
+    
+    def _drop_mirror(self):
+        self._local_complete = False
+        self._local_embs = np.zeros((0, self.dim), dtype=np.float32)
+        self._local_ids = np.zeros(0, dtype=np.int64)
+        self._local_texts = []
+    
+    def _search_locally(self, query_embeddings, top_k, with_embeddings=False):
+        # Exact top-k by inner product over the in-memory mirror
+        scores = query_embeddings @ self._local_embs.T
+        k = min(top_k, scores.shape[1])
+        batch_results = []
+        for query_scores in scores:
+            top = np.argpartition(-query_scores, k - 1)[:k] if k else []
+            top = sorted(top, key=lambda i: -query_scores[i])
+            search_results = [
+                {"text": self._local_texts[i], "score": float(query_scores[i]), "id": int(self._local_ids[i])}
+                for i in top
+            ]
+            if with_embeddings:
+                for hit, i in zip(search_results, top):
+                    hit["embedding"] = self._local_embs[i]
+            batch_results.append(search_results)
+        return batch_results
+    
+    def _searches_locally(self):
+        # True when search never reaches Milvus, so scores are plain inner products
+        return self.backend == "faiss" or self._local_complete
+    
+    def flush_and_reload(self):
+        # Seal growing segments and reload them as indexed segments, e.g. before a benchmark
+        if self.backend == "faiss":
+            # The in-process index has no segments; every add is searchable as is
+            return
+        self.collection.flush()
+        if self._loaded:
+            self.collection.release()
         self.collection.load()
+        self._loaded = True
+    
+    def search(self, query, top_k=3, ef_search=None):
+        # Generate embedding for the query, reusing it for repeated queries
+        query_embedding = self._embed_query(query)
+        if self.semantic_cache_threshold is None:
+            return self._search_embeddings(query_embedding, top_k, ef_search)[0]
+        
+        # Near-duplicate of a recent query: skip the index entirely
+        effective_ef = ef_search or self.ef_search
+        cached_results = self._semantic_cache_lookup(query_embedding, top_k, effective_ef)
+        if cached_results is not None:
+            self.semantic_cache_hits += 1
+            return cached_results
+        self.semantic_cache_misses += 1
         
-        return doc_ids
+        # Fetch the hits' vectors too, so a later cache hit can re-score them
+        search_results = self._search_embeddings(query_embedding, top_k, ef_search, with_embeddings=True)[0]
+        hit_embs = np.zeros((len(search_results), self.dim), dtype=np.float32)
+        for i, hit in enumerate(search_results):
+            hit_embs[i] = hit.pop("embedding")
+        self._semantic_cache_store(query_embedding, top_k, effective_ef, hit_embs, search_results)
+        return search_results
     
-    def search(self, query, top_k=3):
-        # Generate embedding for the query
-        query_embedding = self.model.encode([query])[0].tolist()
+    def search_batch(self, queries, top_k=3, ef_search=None):
+        # Encode all queries in one forward pass and search them in one request
+        query_embeddings = self._encode(queries)
+        return self._search_embeddings(query_embeddings, top_k, ef_search)
+    
+    def _search_embeddings(self, query_embeddings, top_k, ef_search=None, with_embeddings=False):
+        # with_embeddings adds each hit's stored vector under "embedding"
+        if self.backend == "faiss":
+            params = self._faiss.SearchParametersHNSW(efSearch=max(ef_search or self.index.hnsw.efSearch, top_k))
+            scores, ids = self.index.search(query_embeddings, top_k, params=params)
+            # FAISS pads with -1 when the index holds fewer than top_k vectors
+            batch_results = [
+                [
+                    {"text": self.texts[doc_id], "score": float(score), "id": int(doc_id)}
+                    for score, doc_id in zip(query_scores, query_ids)
+                    if doc_id != -1
+                ]
+                for query_scores, query_ids in zip(scores, ids)
+            ]
+            if with_embeddings:
+                for search_results in batch_results:
+                    for hit in search_results:
+                        hit["embedding"] = self.index.reconstruct(hit["id"])
+            return batch_results
+        
+        if self._local_complete:
+            return self._search_locally(query_embeddings, top_k, with_embeddings)
+        
+        # Load collection to memory once; later inserts are served from growing segments
+        if not self._loaded:
+            self.collection.load()
+            self._loaded = True
         
-        # Search parameters
+        # Search parameters; ef must be at least top_k for HNSW
+        if self.index_type.startswith("IVF"):
+            params = {"nprobe": self.nprobe}
+        else:
+            params = {"ef": max(ef_search or self.ef_search, top_k)}
         search_params = {
-            "metric_type": "COSINE",
-            "params": {"ef": 32}
+            "metric_type": self.metric_type,
+            "params": params
         }
         
-        # Perform the search
+        # Perform the search for every query in a single request; the rows are
+        # float32 ndarray views, so no per-element Python floats are created
         results = self.collection.search(
-            data=[query_embedding],
+            data=list(query_embeddings),
             anns_field="embedding",
             param=search_params,
             limit=top_k,
-            output_fields=["text"]
+            output_fields=["text", "embedding"] if with_embeddings else ["text"]
         )
         
-        # Format results
-        search_results = []
-        for hit in results[0]:
-            search_results.append({
-                "text": hit.entity.get("text"),
-                "score": hit.distance,
-                "id": hit.id
-            })
+        # Format results, one list of hits per query
+        batch_results = []
+        for hits in results:
+            search_results = []
+            for hit in hits:
+                search_results.append({
+                    "text": hit.entity.get("text"),
+                    "score": hit.distance,
+                    "id": hit.id
+                })
+                if with_embeddings:
+                    search_results[-1]["embedding"] = np.asarray(hit.entity.get("embedding"), dtype=np.float32)
+            batch_results.append(search_results)
         
-        return search_results
-
-# Demo of the search engine class
-search_engine = SemanticSearchEngine(collection_name="semantic_search_demo")
-
-# Sample documents about various technologies
-tech_documents = [
-    "Blockchain is a distributed ledger technology enabling secure transactions.",
-    "Cloud computing delivers computing services over the internet on-demand.",
-    "Internet of Things (IoT) connects physical devices to the internet.",
-    "Edge computing processes data near the source rather than in a centralized cloud.",
-    "5G networks offer faster speeds and lower latency than previous generations.",
-    "Quantum computing uses quantum mechanics to solve complex problems quickly.",
-    "Augmented Reality (AR) overlays digital content onto the real world.",
-    "Virtual Reality (VR) creates immersive digital environments for users.",
-    "Cybersecurity protects systems and data from digital attacks.",
-    "Big data analytics examines large datasets to uncover patterns and insights."
-]
-
-# Add documents to the search engine
-doc_ids = search_engine.add_documents(tech_documents)
-print(f"Added {len(doc_ids)} documents to the search engine")
-
-# Perform a search
-query = "How does cloud technology work?"
-results = search_engine.search(query, top_k=3)
-
-print(f"\nQuery: {query}")
-for i, result in enumerate(results):
-    print(f"Result {i+1}: {result['text']} (Score: {result['score']:.4f})")
+        return batch_results
 
 # Interactive search terminal
-def enhanced_interactive_search():
+def enhanced_interactive_search(search_engine):
     """Enhanced interactive search with additional features"""
     print("=== Enhanced Interactive Search Terminal ===")
     print("Commands:")
@@ -137,6 +825,9 @@ def enhanced_interactive_search():
     print("  - 'quit', 'exit', or 'q' to stop")
     print("  - Ctrl+C to interrupt\n")
     
+    # Searches run on a worker thread so the prompt stays responsive
+    executor = ThreadPoolExecutor(max_workers=1)
+    
     search_history = np.empty(10, dtype=object)
     is_empty = True
     curr = -1
@@ -190,8 +881,11 @@ def enhanced_interactive_search():
             
             print(f"\nSearching for: '{query}'...")
             
-            # Perform search
-            results = search_engine.search(query, top_k=top_k)
+            # Perform search in the background, printing progress dots while it runs
+            future = executor.submit(search_engine.search, query, top_k=top_k)
+            while wait([future], timeout=0.1).not_done:
+                print(".", end="", flush=True)
+            results = future.result()
             
             # Display results with better formatting
             print(f"\n{'='*60}")
@@ -215,6 +909,40 @@ def enhanced_interactive_search():
         except Exception as e:
             print(f"Error: {e}")
             continue
+    
+    executor.shutdown(wait=False)
 
 if __name__ == "__main__":
-    enhanced_interactive_search()
\ No newline at end of file
+    # Demo of the search engine class. SBERT_PIN_CORES="0,1,2,3" opts into pinning
+    # the process to those cores; it has to happen before the engine starts threads
+    if os.environ.get("SBERT_PIN_CORES"):
+        pin_to_cores(int(core) for core in os.environ["SBERT_PIN_CORES"].split(","))
+    search_engine = SemanticSearchEngine(collection_name="semantic_search_demo", recreate=True)
+
+    # Sample documents about various technologies
+    tech_documents = [
+        "Blockchain is a distributed ledger technology enabling secure transactions.",
+        "Cloud computing delivers computing services over the internet on-demand.",
+        "Internet of Things (IoT) connects physical devices to the internet.",
+        "Edge computing processes data near the source rather than in a centralized cloud.",
+        "5G networks offer faster speeds and lower latency than previous generations.",
+        "Quantum computing uses quantum mechanics to solve complex problems quickly.",
+        "Augmented Reality (AR) overlays digital content onto the real world.",
+        "Virtual Reality (VR) creates immersive digital environments for users.",
+        "Cybersecurity protects systems and data from digital attacks.",
+        "Big data analytics examines large datasets to uncover patterns and insights."
+    ]
+
+    # Add documents to the search engine
+    doc_ids = search_engine.add_documents(tech_documents)
+    print(f"Added {len(doc_ids)} documents to the search engine")
+
+    # Perform a search
+    query = "How does cloud technology work?"
+    results = search_engine.search(query, top_k=3)
+
+    print(f"\nQuery: {query}")
+    for i, result in enumerate(results):
+        print(f"Result {i+1}: {result['text']} (Score: {result['score']:.4f})")
+    
+    enhanced_interactive_search(search_engine)
\ No newline at end of file
@@ -0,0 +1,261 @@
+import hashlib
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+import torch
+
+from vec_graph_db import vectorDB_semantic_search as vdb
+
+DIM = 16
+
+
+def vector_for(text, dim=DIM):
+    # Deterministic unit vector per text, standing in for a real embedding
+    seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], "little")
+    vector = np.random.default_rng(seed).normal(size=dim).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+class FakeModel:
+    # The parts of SentenceTransformer the engine calls
+    device = "cpu"
+
+    def __init__(self, dim=DIM):
+        self.dim = dim
+        self.encoded = []
+
+    def get_sentence_embedding_dimension(self):
+        return self.dim
+
+    def encode(self, texts, **kwargs):
+        self.encoded.append(list(texts))
+        return np.stack([vector_for(text, self.dim) for text in texts])
+
+    def tokenize(self, texts):
+        return {"texts": texts}
+
+    def forward(self, features):
+        return {"sentence_embedding": torch.from_numpy(np.stack([vector_for(t, self.dim) for t in features["texts"]]))}
+
+
+class FakeCollection:
+    # In-memory stand-in for a pymilvus Collection
+    def __init__(self, name, schema):
+        self.name = name
+        self.schema = schema
+        self.indexes = []
+        self.ids = []
+        self.num_entities = 0
+        self.insert_calls = 0
+        self.fail_on_insert = None
+
+    def create_index(self, field_name, index_params):
+        self.indexes.append(SimpleNamespace(field_name=field_name, params=index_params))
+
+    def insert(self, data):
+        self.insert_calls += 1
+        if self.insert_calls == self.fail_on_insert:
+            raise RuntimeError("insert failed")
+        self.ids.extend(int(doc_id) for doc_id in data[0])
+        self.num_entities += len(data[0])
+
+    def flush(self):
+        pass
+
+
+@pytest.fixture
+def milvus(monkeypatch):
+    collections = {}
+
+    def collection(name, schema=None):
+        if schema is None:
+            return collections[name]
+        collections[name] = FakeCollection(name, schema)
+        return collections[name]
+
+    monkeypatch.setattr(vdb, "_load_model", lambda *args, **kwargs: FakeModel())
+    monkeypatch.setattr(vdb, "connections", SimpleNamespace(has_connection=lambda alias: True))
+    monkeypatch.setattr(vdb, "utility", SimpleNamespace(
+        has_collection=lambda name: name in collections,
+        drop_collection=lambda name: collections.pop(name),
+    ))
+    monkeypatch.setattr(vdb, "Collection", collection)
+    return collections
+
+
+@pytest.fixture
+def make_engine(milvus, tmp_path):
+    def make(**kwargs):
+        kwargs.setdefault("collection_name", "test")
+        kwargs.setdefault("device", "cpu")
+        kwargs.setdefault("pca_dir", str(tmp_path / "pca"))
+        return vdb.SemanticSearchEngine(**kwargs)
+    return make
+
+
+def docs(n, prefix="doc"):
+    return [f"{prefix}{i}" for i in range(n)]
+
+
+def test_brute_force_search_returns_exact_top_k(make_engine):
+    engine = make_engine()
+    documents = docs(20)
+    engine.add_documents(documents)
+
+    results = engine.search("query", top_k=5)
+
+    scores = np.stack([vector_for(doc) for doc in documents]) @ vector_for("query")
+    assert [hit["id"] for hit in results] == list(np.argsort(-scores)[:5])
+    assert [hit["text"] for hit in results] == [documents[hit["id"]] for hit in results]
+    assert [hit["score"] for hit in results] == pytest.approx(sorted(scores, reverse=True)[:5], rel=1e-5)
+
+
+def test_brute_force_search_with_fewer_documents_than_top_k(make_engine):
+    engine = make_engine()
+    engine.add_documents(docs(2))
+
+    assert len(engine.search("query", top_k=5)) == 2
+
+
+def test_mirror_is_dropped_past_brute_force_threshold(make_engine):
+    engine = make_engine(brute_force_threshold=10)
+    engine.add_documents(docs(8))
+    assert engine._local_complete
+
+    engine.add_documents(docs(4, prefix="more"))
+    assert not engine._local_complete
+    assert len(engine._local_ids) == 0
+
+
+def test_failed_insert_never_reuses_ids_and_drops_mirror(make_engine, milvus):
+    engine = make_engine(insert_batch_size=2)
+    milvus["test"].fail_on_insert = 2
+
+    with pytest.raises(RuntimeError):
+        engine.add_documents(docs(4))
+
+    # The first chunk is in Milvus but not mirrored, so search must go to Milvus
+    assert milvus["test"].ids == [0, 1]
+    assert not engine._local_complete
+
+    assert engine.add_documents(docs(2, prefix="retry")) == [4, 5]
+    assert len(set(milvus["test"].ids)) == len(milvus["test"].ids)
+
+
+def test_semantic_cache_is_off_by_default(make_engine):
+    engine = make_engine()
+    engine.add_documents(docs(5))
+    engine.search("query")
+    engine.search("query")
+
+    assert engine.semantic_cache_info() == {"hits": 0, "misses": 0, "size": 0}
+
+
+def test_semantic_cache_hit_rescores_for_the_new_query(make_engine):
+    # A threshold of -1 lets any cached query match, so the hit is re-scored
+    # for a query whose true ranking differs
+    engine = make_engine(semantic_cache_threshold=-1.0)
+    engine.add_documents(docs(6))
+    engine.search("first query", top_k=6)
+
+    results = engine.search("second query", top_k=6)
+
+    assert engine.semantic_cache_info()["hits"] == 1
+    expected = engine._search_embeddings(vector_for("second query")[None], top_k=6)[0]
+    assert [hit["id"] for hit in results] == [hit["id"] for hit in expected]
+    assert [hit["score"] for hit in results] == pytest.approx([hit["score"] for hit in expected], rel=1e-5)
+
+
+def test_semantic_cache_misses_for_larger_top_k_or_wider_ef(make_engine):
+    engine = make_engine(semantic_cache_threshold=-1.0)
+    engine.add_documents(docs(6))
+    engine.search("query", top_k=2, ef_search=64)
+
+    engine.search("query", top_k=3, ef_search=64)
+    engine.search("query", top_k=2, ef_search=512)
+    assert engine.semantic_cache_info()["hits"] == 0
+
+    engine.search("query", top_k=1, ef_search=32)
+    assert engine.semantic_cache_info()["hits"] == 1
+
+
+def test_semantic_cache_ring_buffer_evicts_oldest(make_engine):
+    engine = make_engine(semantic_cache_threshold=0.999, semantic_cache_size=2)
+    engine.add_documents(docs(6))
+    for query in ["a", "b", "c"]:
+        engine.search(query)
+
+    engine.search("c")
+    assert engine.semantic_cache_info() == {"hits": 1, "misses": 3, "size": 2}
+    engine.search("a")
+    assert engine.semantic_cache_info()["misses"] == 4
+
+
+def test_semantic_cache_is_cleared_by_inserts(make_engine):
+    engine = make_engine(semantic_cache_threshold=0.999)
+    engine.add_documents(docs(6))
+    engine.search("query")
+    engine.add_documents(docs(2, prefix="new"))
+    engine.search("query")
+
+    assert engine.semantic_cache_info()["hits"] == 0
+
+
+def test_pca_is_fitted_persisted_and_reloaded(make_engine, tmp_path):
+    pytest.importorskip("sklearn")
+    engine = make_engine(pca_dim=4)
+    engine.add_documents(docs(32))
+
+    assert (tmp_path / "pca" / "test.npz").exists()
+    projected = engine._encode(["query"])
+    assert projected.shape == (1, 4)
+    np.testing.assert_allclose(np.linalg.norm(projected, axis=1), 1.0, rtol=1e-5)
+
+    # Reopening the collection loads the saved head and projects the same way
+    reopened = make_engine(pca_dim=4)
+    np.testing.assert_allclose(reopened._encode(["query"]), projected, rtol=1e-6)
+
+
+def test_pca_needs_enough_documents_to_fit(make_engine):
+    pytest.importorskip("sklearn")
+    engine = make_engine(pca_dim=4)
+
+    with pytest.raises(ValueError):
+        engine.add_documents(docs(3))
+
+
+def test_reopen_rejects_mismatched_dimension_or_missing_pca(make_engine, tmp_path):
+    pytest.importorskip("sklearn")
+    make_engine(pca_dim=4).add_documents(docs(32))
+
+    with pytest.raises(ValueError, match="4-d vectors"):
+        make_engine()
+    with pytest.raises(ValueError, match="is missing"):
+        make_engine(pca_dim=4, pca_dir=str(tmp_path / "elsewhere"))
+
+
+def test_disk_cache_only_encodes_misses(make_engine, tmp_path):
+    pytest.importorskip("diskcache")
+    cache_dir = str(tmp_path / "embeddings")
+    first = make_engine(embedding_cache_dir=cache_dir)
+    first.add_documents(["a", "b"])
+
+    second = make_engine(collection_name="other", embedding_cache_dir=cache_dir)
+    second.add_documents(["b", "c", "a"])
+
+    assert second.model.encoded == [["c"]]
+    np.testing.assert_allclose(
+        second._local_embs, np.stack([vector_for("b"), vector_for("c"), vector_for("a")]), rtol=1e-6
+    )
+
+
+def test_disk_cache_is_namespaced_by_model(make_engine, tmp_path):
+    pytest.importorskip("diskcache")
+    cache_dir = str(tmp_path / "embeddings")
+    make_engine(embedding_cache_dir=cache_dir).add_documents(["a"])
+
+    other_model = make_engine(model_name="other-model", collection_name="other", embedding_cache_dir=cache_dir)
+    other_model.add_documents(["a"])
+
+    assert other_model.model.encoded == [["a"]]